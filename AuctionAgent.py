@@ -1,27 +1,76 @@
-from langchain_openai import ChatOpenAI
-from cdp_langchain.agent_toolkits import CdpToolkit
-from cdp_langchain.utils import CdpAgentkitWrapper
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
-from cdp_langchain.tools import CdpTool
+import asyncio
+import contextlib
+import contextvars
+import functools
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import numpy as np
+import orjson
+from prompt_toolkit import PromptSession
 from pydantic import BaseModel, Field
-from cdp import Wallet
 
 from constant import AUCTION_ABI
-from cdp_agentkit_core.actions.deploy_nft import DeployNftAction
-from cdp_agentkit_core.actions.mint_nft import MintNftAction
 
-# Initialize the LLM
-llm = ChatOpenAI(model="gpt-4o-mini")  
+MODEL = "gpt-4o-mini"
 
-# Initialize CDP AgentKit wrapper
-cdp = CdpAgentkitWrapper()
+EMBEDDING_MODEL = "text-embedding-3-small"
 
-# Create toolkit from wrapper
-cdp_toolkit = CdpToolkit.from_cdp_agentkit_wrapper(cdp)
+# Answers to questions this similar to an earlier one are served from the cache
+CACHE_SIMILARITY_THRESHOLD = 0.92
 
-# Get all available tools
-tools = cdp_toolkit.get_tools()
+CACHE_MAX_ENTRIES = 512
+
+# Most inputs the embeddings endpoint accepts in a single request
+EMBEDDING_BATCH_SIZE = 2048
+
+# Number of tools, ranked by similarity to the question, offered to the model each turn
+ROUTER_TOP_K = 3
+
+# When the last routed tool is not at least this much more similar to the question than the
+# first tool left out, the ranking is too close to trust and every tool is offered instead
+ROUTER_MIN_MARGIN = 0.02
+
+# Seconds to wait between status checks of a submitted batch
+BATCH_POLL_INTERVAL = 30
+
+# Read-only tools whose identical calls within one turn can share a single result.
+# A turn is the set of tool calls in a single assistant message; they all run concurrently.
+IDEMPOTENT_TOOLS = frozenset({"get_wallet_details", "get_balance"})
+
+# Likely follow-up questions, embedded in the background while the user types
+FOLLOW_UP_QUESTIONS = (
+    "finalize it",
+    "show my auctions",
+    "what is my balance?",
+    "what can you do?",
+)
+
+SYSTEM_PROMPT = "You are a helpful agent that can interact with the Base blockchain using CDP AgentKit. You can create wallets, deploy tokens, and perform transactions. Call tools directly without describing your plan, and keep answers brief."
+
+# Questions longer than this are rejected before reaching the model
+MAX_QUESTION_LENGTH = 4000
+
+# Rounds of tool calls allowed for one question before the agent gives up
+MAX_TOOL_ROUNDS = 25
+
+USAGE = "Ask a question about your wallet, NFTs or auctions, or type /help. Type 'exit' to quit."
+
+HELP_TEXT = """
+The agent can act onchain for you, for example:
+  - "What is my wallet address?"
+  - "Deploy an NFT collection called MyNFT with symbol MNFT"
+  - "Mint an NFT from 0x... to 0x..."
+  - "Start an auction for token 1 of 0x... at 0.1 ETH for one day"
+  - "Bid 0.2 ETH on token 1"
+  - "Finalize the auction for token 1"
+
+Commands:
+  /help  Show this message
+  exit   Quit
+"""
 
 # Add the NFT Auction functionality
 START_NFT_AUCTION_PROMPT = """
@@ -32,6 +81,36 @@ The auction will run on-chain, and the highest bidder will win the NFT.
 
 AUCTION_CONTRACT_ADDRESS = "0xA0f0b923532fdbcd85A11ccAED1362691C7931fA"
 
+# Single-entry ABIs for each auction contract function, so each call only hands over the method it invokes
+_ABI_BY_METHOD = {item["name"]: [item] for item in AUCTION_ABI if item.get("type") == "function"}
+
+# Plain decimal ETH amounts with at most 18 decimals (1 wei), e.g. `1` or `0.05`
+ETH_AMOUNT_PATTERN = r"^\d+(\.\d{1,18})?$"
+
+WEI_PER_ETH = Decimal(10**18)
+
+# Result messages of the auction tools, filled in with str.format_map
+AUCTION_CREATED_TEMPLATE = (
+    "Auction created successfully for token ID {token_id}.\n"
+    "NFT Contract: {nft_contract_address}\n"
+    "Starting price: {starting_price} ETH\n"
+    "Duration: {duration} seconds\n"
+    "Transaction hash: {transaction_hash}\n"
+    "Transaction link: {transaction_link}"
+)
+
+BID_PLACED_TEMPLATE = (
+    "Bid placed on token ID {token_id} with amount {bid_amount} ETH.\n"
+    "Transaction hash: {transaction_hash}\n"
+    "Transaction link: {transaction_link}"
+)
+
+AUCTION_FINALIZED_TEMPLATE = (
+    "Auction finalized for token ID {token_id}.\n"
+    "Transaction hash: {transaction_hash}\n"
+    "Transaction link: {transaction_link}"
+)
+
 class DeployNftInput(BaseModel):
     name: str = Field(..., description="The name of the NFT collection, e.g., `MyNFT`", example="MyNFT")
     symbol: str = Field(..., description="The symbol of the NFT collection, e.g., `MNFT`", example="MNFT")
@@ -62,10 +141,11 @@ class StartNftAuctionInput(BaseModel):
         description="The ID of the NFT token to auction, e.g., `1`",
         example=1,
     )
-    starting_price: float = Field(
+    starting_price: str = Field(
         ...,
         description="The starting price of the auction in ETH, e.g., `0.1`",
-        example=0.1,
+        example="0.1",
+        pattern=ETH_AMOUNT_PATTERN,
     )
     duration: int = Field(
         ...,
@@ -79,10 +159,11 @@ class BidOnNftInput(BaseModel):
         description="The ID of the NFT token to bid on, e.g., `1`",
         example=1,
     )
-    bid_amount: float = Field(
+    bid_amount: str = Field(
         ...,
         description="The amount of ETH to bid, e.g., `0.5`",
-        example=0.5,
+        example="0.5",
+        pattern=ETH_AMOUNT_PATTERN,
     )
 
 class FinalizeAuctionInput(BaseModel):
@@ -92,28 +173,37 @@ class FinalizeAuctionInput(BaseModel):
         example=1,
     )
 
+# Precompute the JSON schema of each tool input model once, at module load.
+# Keyed by class rather than name: the toolkit ships its own DeployNftInput/MintNftInput.
+_SCHEMAS = {
+    cls: cls.model_json_schema()
+    for cls in (StartNftAuctionInput, BidOnNftInput, FinalizeAuctionInput, DeployNftInput, MintNftInput)
+}
+
+def eth_to_wei(amount: str) -> int:
+    """Convert a decimal ETH amount to wei without going through a float."""
+    return int((Decimal(amount) * WEI_PER_ETH).to_integral_value())
+
 def start_nft_auction(
-    wallet: Wallet,
     nft_contract_address: str,
     token_id: int,
-    starting_price: float,
+    starting_price: str,
     duration: int
 ) -> str:
     """
     Start an NFT auction using the deployed auction contract.
 
     Args:
-        wallet (Wallet): The wallet to create the auction from.
         nft_contract_address (str): The address of the NFT contract.
         token_id (int): The ID of the token to be auctioned.
-        starting_price (float): The starting price of the auction in ETH.
+        starting_price (str): The starting price of the auction in ETH, e.g. `0.1`.
         duration (int): The duration of the auction in seconds.
 
     Returns:
         str: A message containing the auction details.
     """
     try:
-        starting_price_wei = int(starting_price * 10**18)
+        starting_price_wei = eth_to_wei(starting_price)
 
         auction_args = {
             "nftContract": nft_contract_address,
@@ -122,33 +212,32 @@ def start_nft_auction(
             "duration": duration,
         }
 
-        auction_creation = wallet.invoke_contract(
+        auction_creation = _wallet().invoke_contract(
             contract_address=AUCTION_CONTRACT_ADDRESS,  
             method="createAuction",
             args=auction_args,
-            abi=AUCTION_ABI, 
+            abi=_ABI_BY_METHOD["createAuction"], 
         ).wait()
 
-        return (
-            f"Auction created successfully for token ID {token_id}.\n"
-            f"NFT Contract: {nft_contract_address}\n"
-            f"Starting price: {starting_price} ETH\n"
-            f"Duration: {duration} seconds\n"
-            f"Transaction hash: {auction_creation.transaction.transaction_hash}\n"
-            f"Transaction link: {auction_creation.transaction.transaction_link}"
-        )
+        return AUCTION_CREATED_TEMPLATE.format_map({
+            "token_id": token_id,
+            "nft_contract_address": nft_contract_address,
+            "starting_price": starting_price,
+            "duration": duration,
+            "transaction_hash": auction_creation.transaction.transaction_hash,
+            "transaction_link": auction_creation.transaction.transaction_link,
+        })
 
     except Exception as e:
         return f"Error creating auction: {str(e)}"
 
-def bid_on_nft(wallet: Wallet, token_id: int, bid_amount: float) -> str:
+def bid_on_nft(token_id: int, bid_amount: str) -> str:
     """
     Place a bid on an NFT auction.
 
     Args:
-        wallet (Wallet): The wallet to place the bid from.
         token_id (int): The token ID of the NFT to bid on.
-        bid_amount (float): The amount to bid in ETH.
+        bid_amount (str): The amount to bid in ETH, e.g. `0.5`.
 
     Returns:
         str: A message containing the bid details.
@@ -156,29 +245,29 @@ def bid_on_nft(wallet: Wallet, token_id: int, bid_amount: float) -> str:
     try:
         bid_args = {"tokenId": token_id}
 
-        bid_result = wallet.invoke_contract(
+        bid_result = _wallet().invoke_contract(
             contract_address=AUCTION_CONTRACT_ADDRESS,
             method="bid",
             args=bid_args,
-            abi=AUCTION_ABI,
-            value=int(bid_amount * 10**18), 
+            abi=_ABI_BY_METHOD["bid"],
+            value=eth_to_wei(bid_amount),
         ).wait()
 
-        return (
-            f"Bid placed on token ID {token_id} with amount {bid_amount} ETH.\n"
-            f"Transaction hash: {bid_result.transaction.transaction_hash}\n"
-            f"Transaction link: {bid_result.transaction.transaction_link}"
-        )
+        return BID_PLACED_TEMPLATE.format_map({
+            "token_id": token_id,
+            "bid_amount": bid_amount,
+            "transaction_hash": bid_result.transaction.transaction_hash,
+            "transaction_link": bid_result.transaction.transaction_link,
+        })
 
     except Exception as e:
         return f"Error placing bid: {str(e)}"
 
-def finalize_nft_auction(wallet: Wallet, token_id: int) -> str:
+def finalize_nft_auction(token_id: int) -> str:
     """
     Finalize an NFT auction.
 
     Args:
-        wallet (Wallet): The wallet to finalize the auction from.
         token_id (int): The token ID of the NFT to finalize.
 
     Returns:
@@ -187,88 +276,650 @@ def finalize_nft_auction(wallet: Wallet, token_id: int) -> str:
     try:
         finalize_args = {"tokenId": token_id}
 
-        finalize_result = wallet.invoke_contract(
+        finalize_result = _wallet().invoke_contract(
             contract_address=AUCTION_CONTRACT_ADDRESS,
             method="finalizeAuction",
             args=finalize_args,
-            abi=AUCTION_ABI,
+            abi=_ABI_BY_METHOD["finalizeAuction"],
         ).wait()
 
-        return (
-            f"Auction finalized for token ID {token_id}.\n"
-            f"Transaction hash: {finalize_result.transaction.transaction_hash}\n"
-            f"Transaction link: {finalize_result.transaction.transaction_link}"
-        )
+        return AUCTION_FINALIZED_TEMPLATE.format_map({
+            "token_id": token_id,
+            "transaction_hash": finalize_result.transaction.transaction_hash,
+            "transaction_link": finalize_result.transaction.transaction_link,
+        })
 
     except Exception as e:
         return f"Error finalizing auction: {str(e)}"
 
-startNftAuctionTool = CdpTool(
-    name="start_nft_auction",
-    description=START_NFT_AUCTION_PROMPT,
-    cdp_agentkit_wrapper=cdp,
-    args_schema=StartNftAuctionInput,
-    func=start_nft_auction,
-)
+# The OpenAI client of the running agent call. Its pooled connections belong to the event loop
+# that opened them, so each top-level coroutine opens its own client with _openai_client().
+_CLIENT: contextvars.ContextVar = contextvars.ContextVar("openai_client", default=None)
 
-bidOnNftTool = CdpTool(
-    name="bid_on_nft",
-    description="Place a bid on an NFT auction.",
-    cdp_agentkit_wrapper=cdp,
-    args_schema=BidOnNftInput, 
-    func=bid_on_nft,
-)
+@contextlib.asynccontextmanager
+async def _openai_client():
+    """
+    Use the OpenAI client already open in this context, or open one and close it on exit.
 
-finalizeAuctionTool = CdpTool(
-    name="finalize_nft_auction",
-    description="Finalize an NFT auction and transfer the token to the highest bidder.",
-    cdp_agentkit_wrapper=cdp,
-    args_schema=FinalizeAuctionInput, 
-    func=finalize_nft_auction,
-)
+    Every OpenAI call (completions, embeddings and batches) within it shares one pooled HTTP client.
+    HTTP/2 needs the optional `h2` package; without it the pool falls back to HTTP/1.1 keep-alive.
+    """
+    if _CLIENT.get() is not None:
+        yield
+        return
 
-deployNftTool = CdpTool(
-    name="deploy_nft",
-    description="Deploy an ERC-721 NFT contract with a given name, symbol, and base URI.",
-    cdp_agentkit_wrapper=cdp,
-    args_schema=DeployNftInput,
-    func=DeployNftAction().func,  
-)
+    import httpx
+    from openai import AsyncOpenAI
 
-mintNftTool = CdpTool(
-    name="mint_nft",
-    description="Mint an NFT from an existing ERC-721 contract.",
-    cdp_agentkit_wrapper=cdp,
-    args_schema=MintNftInput,
-    func=MintNftAction().func,  
-)
+    http_client = httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_keepalive_connections=20),
+        timeout=30.0,
+    )
+    client = AsyncOpenAI(http_client=http_client)
+    token = _CLIENT.set(client)
+    try:
+        yield
+    finally:
+        _CLIENT.reset(token)
+        await client.close()
+
+def _client():
+    """Return the OpenAI client opened by the enclosing _openai_client() block."""
+    client = _CLIENT.get()
+    if client is None:
+        raise RuntimeError("No OpenAI client is open; call this from within `async with _openai_client():`")
+    return client
+
+@functools.cache
+def _init():
+    """
+    Set up the CDP wallet and the agent's tools on first use.
 
-tools.extend([startNftAuctionTool, bidOnNftTool, finalizeAuctionTool, deployNftTool, mintNftTool])
+    The LangChain and CDP imports and the wallet setup, which talks to the CDP API,
+    are deferred until here so the prompt comes up without waiting on them.
 
-# Create the agent
-agent_executor = create_react_agent(
-    llm,
-    tools=tools,
-    state_modifier="You are a helpful agent that can interact with the Base blockchain using CDP AgentKit. You can create wallets, deploy tokens, and perform transactions."
-)
+    Returns:
+        tuple: The CDP AgentKit wrapper, the tools by name, and their function-calling schemas.
+    """
+    from cdp_agentkit_core.actions import CDP_ACTIONS
+    from cdp_agentkit_core.actions.deploy_nft import DeployNftAction
+    from cdp_agentkit_core.actions.mint_nft import MintNftAction
+    from cdp_langchain.agent_toolkits import CdpToolkit
+    from cdp_langchain.tools import CdpTool
+    from cdp_langchain.utils import CdpAgentkitWrapper
+
+    # Initialize CDP AgentKit wrapper in a worker thread: wallet setup waits on the CDP API,
+    # so cache the schemas of the toolkit's input models while it runs
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        cdp_future = executor.submit(CdpAgentkitWrapper)
+
+        for action in CDP_ACTIONS:
+            if action.args_schema not in _SCHEMAS:
+                _SCHEMAS[action.args_schema] = action.args_schema.model_json_schema()
+
+        cdp = cdp_future.result()
+
+    # Create toolkit from wrapper
+    cdp_toolkit = CdpToolkit.from_cdp_agentkit_wrapper(cdp)
+
+    # Get all available tools
+    tools = cdp_toolkit.get_tools()
+
+    startNftAuctionTool = CdpTool(
+        name="start_nft_auction",
+        description=START_NFT_AUCTION_PROMPT,
+        cdp_agentkit_wrapper=cdp,
+        args_schema=StartNftAuctionInput,
+        func=start_nft_auction,
+    )
 
-# Function to interact with the agent
-def ask_agent(question: str):
-    for chunk in agent_executor.stream(
-        {"messages": [HumanMessage(content=question)]},
-        {"configurable": {"thread_id": "my_first_agent"}}
-    ):
-        if "agent" in chunk:
-            print(chunk["agent"]["messages"][0].content)
-        elif "tools" in chunk:
-            print(chunk["tools"]["messages"][0].content)
+    bidOnNftTool = CdpTool(
+        name="bid_on_nft",
+        description="Place a bid on an NFT auction.",
+        cdp_agentkit_wrapper=cdp,
+        args_schema=BidOnNftInput, 
+        func=bid_on_nft,
+    )
+
+    finalizeAuctionTool = CdpTool(
+        name="finalize_nft_auction",
+        description="Finalize an NFT auction and transfer the token to the highest bidder.",
+        cdp_agentkit_wrapper=cdp,
+        args_schema=FinalizeAuctionInput, 
+        func=finalize_nft_auction,
+    )
+
+    deployNftTool = CdpTool(
+        name="deploy_nft",
+        description="Deploy an ERC-721 NFT contract with a given name, symbol, and base URI.",
+        cdp_agentkit_wrapper=cdp,
+        args_schema=DeployNftInput,
+        func=DeployNftAction().func,  
+    )
+
+    mintNftTool = CdpTool(
+        name="mint_nft",
+        description="Mint an NFT from an existing ERC-721 contract.",
+        cdp_agentkit_wrapper=cdp,
+        args_schema=MintNftInput,
+        func=MintNftAction().func,  
+    )
+
+    tools.extend([startNftAuctionTool, bidOnNftTool, finalizeAuctionTool, deployNftTool, mintNftTool])
+
+    # Index tools by name; the deploy/mint tools above replace the toolkit's versions
+    tools_by_name = {tool.name: tool for tool in tools}
+
+    # Build the function-calling schema for every tool from the cached schemas
+    tool_specs = [
+        {
+            "type": "function",
+            "function": {
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": _SCHEMAS[tool.args_schema],
+            },
+        }
+        for tool in tools_by_name.values()
+    ]
+
+    return cdp, tools_by_name, tool_specs
+
+@functools.cache
+def _wallet():
+    """
+    Return the agent's wallet, shared by the auction tools across turns.
+
+    Tools run in worker threads, but each turn calls _init() on the event loop first,
+    so those threads only ever read the already-created wallet.
+    """
+    cdp, _, _ = _init()
+    return cdp.wallet
+
+def run_tool(name: str, arguments: str) -> str:
+    """
+    Validate the arguments of a tool call and run the matching tool.
+
+    Args:
+        name (str): The name of the tool requested by the model.
+        arguments (str): The JSON-encoded arguments of the tool call.
+
+    Returns:
+        str: The tool output, or an error message the model can react to.
+    """
+    cdp, tools_by_name, _ = _init()
+    tool = tools_by_name.get(name)
+    if tool is None:
+        return f"Error: unknown tool {name}"
+
+    try:
+        args = tool.args_schema(**orjson.loads(arguments or "{}")).model_dump()
+        return cdp.run_action(tool.func, **args)
+    except Exception as e:
+        return f"Error running {name}: {str(e)}"
+
+async def run_tool_async(name: str, arguments: str) -> str:
+    """Run a tool call in a worker thread so independent calls can overlap."""
+    return await asyncio.to_thread(run_tool, name, arguments)
+
+def schedule_tool(seen: dict[tuple[str, bytes | str], asyncio.Future], name: str, arguments: str) -> asyncio.Future:
+    """
+    Schedule a tool call, reusing an identical read-only call from the same turn.
+
+    A turn is the tool calls of one assistant message. Calls from later messages always run
+    again, since tools that ran in between may have changed the onchain state they read.
+
+    Args:
+        seen (dict): Scheduled read-only calls of the current turn, keyed by tool name and arguments.
+        name (str): The name of the tool requested by the model.
+        arguments (str): The JSON-encoded arguments of the tool call.
+
+    Returns:
+        asyncio.Future: A future resolving to the tool output.
+    """
+    if name not in IDEMPOTENT_TOOLS:
+        return asyncio.ensure_future(run_tool_async(name, arguments))
+
+    try:
+        key = (name, orjson.dumps(orjson.loads(arguments or "{}"), option=orjson.OPT_SORT_KEYS))
+    except ValueError:
+        key = (name, arguments)
+
+    if key not in seen:
+        seen[key] = asyncio.ensure_future(run_tool_async(name, arguments))
+    return seen[key]
+
+# Normalized embeddings of recently seen or prefetched texts, in insertion order
+_EMBEDDING_CACHE: dict[str, np.ndarray] = {}
+
+def _store_embedding(text: str, embedding: list[float]) -> np.ndarray:
+    """Normalize an embedding and remember it, dropping the oldest entry when full."""
+    normalized = np.asarray(embedding)
+    normalized = normalized / np.linalg.norm(normalized)
+    _EMBEDDING_CACHE[text] = normalized
+    if len(_EMBEDDING_CACHE) > CACHE_MAX_ENTRIES:
+        del _EMBEDDING_CACHE[next(iter(_EMBEDDING_CACHE))]
+    return normalized
+
+async def embed(text: str) -> np.ndarray:
+    """Embed a piece of text and normalize it to unit length."""
+    if text in _EMBEDDING_CACHE:
+        return _EMBEDDING_CACHE[text]
+
+    response = await _client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return _store_embedding(text, response.data[0].embedding)
+
+async def embed_many(texts: list[str]) -> list[np.ndarray]:
+    """Embed several texts, requesting the ones not in the cache in as few requests as possible."""
+    embeddings = {text: _EMBEDDING_CACHE[text] for text in texts if text in _EMBEDDING_CACHE}
+    missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+    for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        chunk = missing[start:start + EMBEDDING_BATCH_SIZE]
+        response = await _client().embeddings.create(model=EMBEDDING_MODEL, input=chunk)
+        for text, item in zip(chunk, response.data):
+            embeddings[text] = _store_embedding(text, item.embedding)
+
+    return [embeddings[text] for text in texts]
+
+async def prefetch_embeddings(texts: tuple[str, ...]):
+    """Embed texts ahead of time in a single request; failures only cost the prefetch."""
+    try:
+        await embed_many(list(texts))
+    except Exception:
+        return
+
+# Normalized embeddings of the tool descriptions, computed on the first routed question
+_TOOL_EMBEDDINGS: np.ndarray | None = None
+
+async def route_tools(embedding: np.ndarray) -> list[dict]:
+    """
+    Select the tools whose descriptions are most similar to a question.
+
+    Args:
+        embedding (np.ndarray): The normalized embedding of the question.
+
+    Returns:
+        list[dict]: The function-calling schemas of the ROUTER_TOP_K closest tools, or of every
+            tool when the cut-off between them and the rest is within ROUTER_MIN_MARGIN.
+    """
+    global _TOOL_EMBEDDINGS
+
+    _, _, tool_specs = _init()
+    if _TOOL_EMBEDDINGS is None:
+        response = await _client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=[spec["function"]["description"] for spec in tool_specs],
+        )
+        tool_embeddings = np.asarray([item.embedding for item in response.data])
+        _TOOL_EMBEDDINGS = tool_embeddings / np.linalg.norm(tool_embeddings, axis=1, keepdims=True)
+
+    if len(tool_specs) <= ROUTER_TOP_K:
+        return tool_specs
+
+    similarities = _TOOL_EMBEDDINGS @ embedding
+    ranking = np.argsort(-similarities)
+    if similarities[ranking[ROUTER_TOP_K - 1]] - similarities[ranking[ROUTER_TOP_K]] < ROUTER_MIN_MARGIN:
+        return tool_specs
+    return [tool_specs[index] for index in ranking[:ROUTER_TOP_K]]
+
+class SemanticCache:
+    """
+    LRU cache of responses, looked up by the similarity of a new question to the cached ones.
+
+    The normalized question embeddings are kept as rows of one preallocated matrix, so a lookup
+    is a single matrix-vector product and storing an entry writes one row in place.
+    """
+
+    def __init__(self, threshold: float = CACHE_SIMILARITY_THRESHOLD, max_entries: int = CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # Question -> row of its embedding in the matrix, least recently used first
+        self._rows: OrderedDict[str, int] = OrderedDict()
+        self._responses: list[str] = []
+        self._questions: list[str] = []
+        self._matrix: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def lookup(self, embedding: np.ndarray) -> str | None:
+        """Return the cached response to the most similar earlier question, if it is close enough."""
+        if not self._rows:
+            return None
+
+        similarities = self._matrix[:len(self._questions)] @ embedding
+        best = int(similarities.argmax())
+        if similarities[best] <= self.threshold:
+            return None
+
+        self._rows.move_to_end(self._questions[best])
+        return self._responses[best]
+
+    def store(self, question: str, embedding: np.ndarray, response: str):
+        """Store a response, overwriting the least recently used entry when full."""
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, embedding.shape[0]))
+
+        if question in self._rows:
+            row = self._rows[question]
+        elif len(self._rows) < self.max_entries:
+            row = len(self._rows)
+            self._questions.append(question)
+            self._responses.append(response)
+        else:
+            _, row = self._rows.popitem(last=False)
+
+        self._rows[question] = row
+        self._rows.move_to_end(question)
+        self._questions[row] = question
+        self._responses[row] = response
+        self._matrix[row] = embedding
+
+# Only answers that ran no tools are stored, since those cannot have changed onchain state
+_RESPONSE_CACHE = SemanticCache()
+
+def build_messages(question: str) -> list[dict]:
+    """Build the opening conversation for a user question."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": question},
+    ]
+
+async def complete(messages: list[dict], tool_specs: list[dict], echo: bool = True) -> dict:
+    """
+    Stream the next assistant message for a conversation.
+
+    Args:
+        messages (list[dict]): The conversation so far.
+        tool_specs (list[dict]): The function-calling schemas of the tools offered to the model.
+        echo (bool): Whether to print reply tokens as they arrive.
+
+    Returns:
+        dict: The assembled assistant message, including any tool calls.
+    """
+    stream = await _client().chat.completions.create(
+        model=MODEL,
+        messages=messages,
+        tools=tool_specs,
+        tool_choice="auto",
+        stream=True,
+    )
+
+    content = []
+    tool_calls: dict[int, dict] = {}
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+
+        if delta.content:
+            if echo:
+                print(delta.content, end="", flush=True)
+            content.append(delta.content)
+
+        # Tool calls arrive in fragments keyed by their index in the message
+        for fragment in delta.tool_calls or []:
+            tool_call = tool_calls.setdefault(fragment.index, {
+                "id": "",
+                "type": "function",
+                "function": {"name": "", "arguments": ""},
+            })
+            if fragment.id:
+                tool_call["id"] = fragment.id
+            if fragment.function and fragment.function.name:
+                tool_call["function"]["name"] += fragment.function.name
+            if fragment.function and fragment.function.arguments:
+                tool_call["function"]["arguments"] += fragment.function.arguments
+
+    if echo and content:
+        print()
+        print("-------------------")
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+    return message
+
+async def run_agent(
+    messages: list[dict],
+    tool_specs: list[dict],
+    message: dict | None = None,
+    echo: bool = True,
+) -> tuple[str, bool]:
+    """
+    Run the tool-calling loop until the model answers without requesting a tool.
+
+    The loop stops with an error message after MAX_TOOL_ROUNDS rounds of tool calls, so a model
+    that keeps retrying a failing tool cannot spend tokens or submit transactions without end.
+
+    After the first round of tool calls every tool is offered, so a multi-step request
+    (e.g. deploy, mint, then auction) is not limited to the tools routed for the question.
+
+    Args:
+        messages (list[dict]): The conversation so far; tool calls and results are appended to it.
+        tool_specs (list[dict]): The function-calling schemas of the tools offered for the first completion.
+        message (dict | None): An assistant message already obtained for the conversation, e.g. from a batch.
+        echo (bool): Whether to print replies and tool results as they arrive.
+
+    Returns:
+        tuple[str, bool]: The model's replies, and whether any tool was run.
+    """
+    replies = []
+    used_tools = False
+
+    for _ in range(MAX_TOOL_ROUNDS):
+        if message is None:
+            message = await complete(messages, tool_specs, echo)
+        elif echo and message.get("content"):
+            print(message["content"])
+            print("-------------------")
+
+        if message.get("content"):
+            replies.append(message["content"])
+
+        tool_calls = message.get("tool_calls")
+        if not tool_calls:
+            return "\n".join(replies), used_tools
+
+        used_tools = True
+        messages.append(message)
+
+        # Tool calls returned in the same turn are independent, so wait on them together
+        seen = {}
+        results = await asyncio.gather(*[
+            schedule_tool(seen, tool_call["function"]["name"], tool_call["function"]["arguments"])
+            for tool_call in tool_calls
+        ])
+        for tool_call, result in zip(tool_calls, results):
+            if echo:
+                print(result)
+                print("-------------------")
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": result,
+            })
+
+        message = None
+        _, _, tool_specs = _init()
+
+    error = f"Error: stopped after {MAX_TOOL_ROUNDS} rounds of tool calls without a final answer."
+    if echo:
+        print(error)
         print("-------------------")
+    replies.append(error)
+    return "\n".join(replies), used_tools
+
+def handle_command(command: str):
+    """Answer a slash command locally, without calling the model."""
+    if command.split()[0] == "/help":
+        print(HELP_TEXT)
+    else:
+        print(f"Unknown command {command.split()[0]}. {USAGE}")
+
+def check_question(question: str) -> str | None:
+    """Return why a stripped question should not be sent to the model, or None if it can be."""
+    if not question:
+        return USAGE
+    if not any(char.isalnum() for char in question):
+        return f"That doesn't look like a question. {USAGE}"
+    if len(question) > MAX_QUESTION_LENGTH:
+        return f"Questions are limited to {MAX_QUESTION_LENGTH} characters."
+    return None
+
+# Function to interact with the agent
+async def ask_agent(question: str):
+    # Answer malformed input locally rather than spending a model round trip on it
+    question = question.strip()
+    if question.startswith("/"):
+        handle_command(question)
+        return
+    problem = check_question(question)
+    if problem is not None:
+        print(problem)
+        return
+
+    async with _openai_client():
+        # The cache and the router only save cost: if an embedding request fails, skip them,
+        # answer with every tool and leave the answer out of the cache
+        try:
+            embedding = await embed(question)
+        except Exception:
+            embedding = None
+
+        if embedding is not None:
+            cached_response = _RESPONSE_CACHE.lookup(embedding)
+            if cached_response is not None:
+                print(cached_response)
+                print("-------------------")
+                return
+
+        # Only offer the model the tools relevant to this question
+        _, _, all_tool_specs = _init()
+        tool_specs = all_tool_specs
+        if embedding is not None:
+            try:
+                tool_specs = await route_tools(embedding)
+            except Exception:
+                embedding = None
+
+        response, used_tools = await run_agent(build_messages(question), tool_specs)
+
+        # A tool-free reply to a routed subset may only mean the router missed the right tool,
+        # so only replies given with every tool on offer are cached
+        if embedding is not None and not used_tools and response and len(tool_specs) == len(all_tool_specs):
+            _RESPONSE_CACHE.store(question, embedding, response)
+
+async def batch_ask_agent(questions: list[str]) -> list[str]:
+    """
+    Answer a list of questions through the OpenAI Batch API.
+
+    The first completion of every question is submitted as one batch, which is billed at half
+    price but may take up to 24 hours. Tool calls in the batched answers, and any completions
+    that follow them, are then run in order of the questions.
+
+    Tools are routed as in ask_agent: each batched request offers the tools closest to its
+    question, or every tool when the ranking is too close to call, and later rounds offer every tool.
+
+    Args:
+        questions (list[str]): The questions to ask the agent.
+
+    Returns:
+        list[str]: The agent's response to each question, in the same order.
+
+    Raises:
+        ValueError: If a question is blank, has no letters or digits, or is too long.
+    """
+    if not questions:
+        return []
+
+    questions = [question.strip() for question in questions]
+    for i, question in enumerate(questions):
+        problem = check_question(question)
+        if problem is not None:
+            raise ValueError(f"Invalid question {i}: {problem}")
+
+    async with _openai_client():
+        client = _client()
+
+        conversations = [build_messages(question) for question in questions]
+
+        # As in ask_agent, a failed embedding request only costs the routing
+        try:
+            routed_tools = [await route_tools(embedding) for embedding in await embed_many(questions)]
+        except Exception:
+            _, _, all_tool_specs = _init()
+            routed_tools = [all_tool_specs] * len(questions)
+        requests = [
+            orjson.dumps({
+                "custom_id": f"q{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": MODEL, "messages": messages, "tools": tool_specs, "tool_choice": "auto"},
+            })
+            for i, (messages, tool_specs) in enumerate(zip(conversations, routed_tools))
+        ]
+
+        batch_file = await client.files.create(
+            file=("questions.jsonl", b"\n".join(requests)),
+            purpose="batch",
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = await client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} finished with status {batch.status}")
+
+        first_messages = {}
+        if batch.output_file_id:
+            output = await client.files.content(batch.output_file_id)
+            for line in output.content.splitlines():
+                result = orjson.loads(line)
+                if result["response"] and result["response"]["status_code"] == 200:
+                    first_messages[result["custom_id"]] = result["response"]["body"]["choices"][0]["message"]
+
+        # Run the answers one after another so onchain actions keep the order of the questions
+        responses = []
+        for i, (messages, tool_specs) in enumerate(zip(conversations, routed_tools)):
+            message = first_messages.get(f"q{i}")
+            if message is None:
+                responses.append(f"Error: no batch response for question {i}")
+                continue
+            response, _ = await run_agent(messages, tool_specs, message, echo=False)
+            responses.append(response)
+
+        return responses
+
+# Run the chat loop with one OpenAI client for the whole session, closed when it ends
+async def main():
+    session = PromptSession()
+
+    async with _openai_client():
+        # Warm the embedding cache with likely follow-ups while the user is typing
+        prefetch = asyncio.create_task(prefetch_embeddings(FOLLOW_UP_QUESTIONS))
+
+        print("Agent is ready! Type 'exit' to quit.")
+        while True:
+            try:
+                user_input = await session.prompt_async("\nYou: ")
+            except (EOFError, KeyboardInterrupt):
+                break
+            if user_input.lower() == 'exit':
+                break
+            await ask_agent(user_input)
+
+        prefetch.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await prefetch
 
 # Test the agent
 if __name__ == "__main__":
-    print("Agent is ready! Type 'exit' to quit.")
-    while True:
-        user_input = input("\nYou: ")
-        if user_input.lower() == 'exit':
-            break
-        ask_agent(user_input)
\ No newline at end of file
+    asyncio.run(main())
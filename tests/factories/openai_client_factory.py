@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from AuctionAgent import _CLIENT
+
+
+def text_chunk(content):
+    """Create a streamed completion chunk carrying reply text."""
+    delta = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def tool_call_chunk(index, tool_call_id=None, name=None, arguments=None):
+    """Create a streamed completion chunk carrying a fragment of one tool call."""
+    fragment = SimpleNamespace(
+        index=index,
+        id=tool_call_id,
+        function=SimpleNamespace(name=name, arguments=arguments),
+    )
+    delta = SimpleNamespace(content=None, tool_calls=[fragment])
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def run_with_client(client, coroutine):
+    """Run a coroutine on a fresh event loop with the given client open."""
+
+    async def _run():
+        _CLIENT.set(client)
+        return await coroutine
+
+    return asyncio.run(_run())
+
+
+class _Stream:
+    """Async iterator over the chunks of one streamed completion."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+@pytest.fixture
+def openai_client_factory():
+    """Create and return a factory for fake AsyncOpenAI clients."""
+
+    def _create_client(completions=(), embeddings=None):
+        """Create a client streaming `completions` in order and embedding texts from `embeddings`.
+
+        `embeddings` maps texts to vectors, or is an exception raised by every embedding request.
+        """
+        client = SimpleNamespace(completion_requests=[], embedding_requests=[])
+        replies = list(completions)
+
+        async def create_completion(**kwargs):
+            client.completion_requests.append(kwargs)
+            return _Stream(replies.pop(0))
+
+        async def create_embedding(model, input):
+            client.embedding_requests.append(input)
+            if isinstance(embeddings, Exception):
+                raise embeddings
+            texts = [input] if isinstance(input, str) else input
+            return SimpleNamespace(data=[SimpleNamespace(embedding=embeddings[text]) for text in texts])
+
+        client.chat = SimpleNamespace(completions=SimpleNamespace(create=create_completion))
+        client.embeddings = SimpleNamespace(create=create_embedding)
+        return client
+
+    return _create_client
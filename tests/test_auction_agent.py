@@ -0,0 +1,339 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import AuctionAgent
+from AuctionAgent import (
+    _CLIENT,
+    IDEMPOTENT_TOOLS,
+    MAX_QUESTION_LENGTH,
+    ROUTER_TOP_K,
+    BidOnNftInput,
+    SemanticCache,
+    StartNftAuctionInput,
+    _client,
+    _openai_client,
+    ask_agent,
+    batch_ask_agent,
+    build_messages,
+    complete,
+    eth_to_wei,
+    route_tools,
+    run_agent,
+    schedule_tool,
+)
+from tests.factories.openai_client_factory import run_with_client, text_chunk, tool_call_chunk
+
+MOCK_NFT_CONTRACT_ADDRESS = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+MOCK_TOKEN_ID = 1
+MOCK_DURATION = 86400
+
+
+@pytest.mark.parametrize(
+    ("amount", "expected_wei"),
+    [
+        ("1", 1000000000000000000),
+        ("0.1", 100000000000000000),
+        ("1.15", 1150000000000000000),
+        ("0.000000000000000001", 1),
+    ],
+)
+def test_eth_to_wei_is_exact(amount, expected_wei):
+    """Test that eth_to_wei converts decimal ETH amounts without float rounding."""
+    assert eth_to_wei(amount) == expected_wei
+
+
+def test_start_nft_auction_input_model_valid():
+    """Test that StartNftAuctionInput accepts a starting price with up to 18 decimals."""
+    input_model = StartNftAuctionInput(
+        nft_contract_address=MOCK_NFT_CONTRACT_ADDRESS,
+        token_id=MOCK_TOKEN_ID,
+        starting_price="0.000000000000000001",
+        duration=MOCK_DURATION,
+    )
+
+    assert input_model.starting_price == "0.000000000000000001"
+
+
+@pytest.mark.parametrize("amount", ["0.0000000000000000004", "-1", "1e18", "0.", "abc"])
+def test_bid_on_nft_input_model_invalid_amount(amount):
+    """Test that BidOnNftInput rejects amounts that are not exact wei values."""
+    with pytest.raises(ValueError):
+        BidOnNftInput(token_id=MOCK_TOKEN_ID, bid_amount=amount)
+
+
+def test_batch_ask_agent_empty_questions():
+    """Test that batch_ask_agent returns no responses for no questions."""
+    assert asyncio.run(batch_ask_agent([])) == []
+
+
+@pytest.mark.parametrize("question", ["", "   ", "?!", "a" * (MAX_QUESTION_LENGTH + 1)])
+def test_batch_ask_agent_invalid_question(question):
+    """Test that batch_ask_agent rejects invalid questions before calling the API."""
+    with pytest.raises(ValueError):
+        asyncio.run(batch_ask_agent(["What is my balance?", question]))
+
+
+def test_client_requires_open_block():
+    """Test that _client refuses to run outside an _openai_client block."""
+    with pytest.raises(RuntimeError):
+        _client()
+
+
+def test_openai_client_reuses_open_client():
+    """Test that a nested _openai_client block keeps the client of the enclosing one."""
+    mock_client = object()
+
+    async def use_nested_block():
+        _CLIENT.set(mock_client)
+        async with _openai_client():
+            return _client()
+
+    assert asyncio.run(use_nested_block()) is mock_client
+    assert _CLIENT.get() is None
+
+
+MOCK_TOOL_SPECS = [
+    {"type": "function", "function": {"name": f"tool_{i}", "description": f"tool {i}", "parameters": {}}}
+    for i in range(5)
+]
+
+MOCK_TOOL_EMBEDDINGS = {f"tool {i}": [1.0 if j == i else 0.0 for j in range(5)] for i in range(5)}
+
+
+@pytest.fixture
+def agent_state(monkeypatch):
+    """Give AuctionAgent mock tools and empty caches, without touching CDP."""
+    monkeypatch.setattr(AuctionAgent, "_init", lambda: (None, {}, MOCK_TOOL_SPECS))
+    monkeypatch.setattr(AuctionAgent, "_TOOL_EMBEDDINGS", None)
+    monkeypatch.setattr(AuctionAgent, "_EMBEDDING_CACHE", {})
+    monkeypatch.setattr(AuctionAgent, "_RESPONSE_CACHE", SemanticCache())
+
+
+def _unit(vector):
+    return list(np.asarray(vector) / np.linalg.norm(vector))
+
+
+def test_route_tools_picks_top_k_with_clear_margin(agent_state, openai_client_factory):
+    """Test that route_tools offers only the closest tools when the ranking is clear."""
+    client = openai_client_factory(embeddings=MOCK_TOOL_EMBEDDINGS)
+    embedding = np.asarray(_unit([0.6, 0.5, 0.4, 0.1, 0.1]))
+
+    tool_specs = run_with_client(client, route_tools(embedding))
+
+    assert [spec["function"]["name"] for spec in tool_specs] == ["tool_0", "tool_1", "tool_2"]
+
+
+def test_route_tools_offers_every_tool_with_low_margin(agent_state, openai_client_factory):
+    """Test that route_tools falls back to every tool when the cut-off is too close to call."""
+    client = openai_client_factory(embeddings=MOCK_TOOL_EMBEDDINGS)
+    embedding = np.asarray(_unit([0.6, 0.5, 0.4, 0.395, 0.1]))
+
+    tool_specs = run_with_client(client, route_tools(embedding))
+
+    assert tool_specs == MOCK_TOOL_SPECS
+
+
+def test_ask_agent_streams_routed_reply_without_caching_it(agent_state, openai_client_factory, capsys):
+    """Test that a tool-free reply to a routed subset is streamed once and not cached."""
+    question = "what can you do?"
+    client = openai_client_factory(
+        completions=[[text_chunk("I can "), text_chunk("help.")]],
+        embeddings={**MOCK_TOOL_EMBEDDINGS, question: [0.6, 0.5, 0.4, 0.1, 0.1]},
+    )
+
+    run_with_client(client, ask_agent(question))
+
+    assert len(client.completion_requests) == 1
+    assert len(client.completion_requests[0]["tools"]) == ROUTER_TOP_K
+    assert "I can help." in capsys.readouterr().out
+    assert not AuctionAgent._RESPONSE_CACHE
+
+
+def test_run_agent_offers_every_tool_after_a_tool_round(agent_state, openai_client_factory, monkeypatch):
+    """Test that run_agent widens a routed tool list once a round of tool calls has run."""
+
+    async def mock_run_tool_async(name, arguments):
+        return f"{name} done"
+
+    monkeypatch.setattr(AuctionAgent, "run_tool_async", mock_run_tool_async)
+    client = openai_client_factory(completions=[
+        [tool_call_chunk(0, "call_0", "tool_0", "{}")],
+        [text_chunk("Done.")],
+    ])
+
+    response, used_tools = run_with_client(
+        client, run_agent(build_messages("deploy and mint"), MOCK_TOOL_SPECS[:ROUTER_TOP_K], echo=False)
+    )
+
+    assert (response, used_tools) == ("Done.", True)
+    assert [len(request["tools"]) for request in client.completion_requests] == [ROUTER_TOP_K, len(MOCK_TOOL_SPECS)]
+
+
+def test_ask_agent_without_embeddings_uses_every_tool(agent_state, openai_client_factory, capsys):
+    """Test that ask_agent still answers, with every tool and no caching, when embedding fails."""
+    client = openai_client_factory(
+        completions=[[text_chunk("Hello.")]],
+        embeddings=RuntimeError("rate limited"),
+    )
+
+    run_with_client(client, ask_agent("hello"))
+
+    assert len(client.completion_requests[0]["tools"]) == len(MOCK_TOOL_SPECS)
+    assert "Hello." in capsys.readouterr().out
+    assert not AuctionAgent._RESPONSE_CACHE
+
+
+def test_semantic_cache_hit_and_miss():
+    """Test that SemanticCache answers only questions above its similarity threshold."""
+    cache = SemanticCache(threshold=0.9)
+    cache.store("what can you do?", np.asarray([1.0, 0.0]), "I can help.")
+
+    assert cache.lookup(np.asarray(_unit([1.0, 0.1]))) == "I can help."
+    assert cache.lookup(np.asarray(_unit([1.0, 1.0]))) is None
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    """Test that SemanticCache overwrites the least recently used entry once full."""
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    cache.store("a", np.asarray([1.0, 0.0, 0.0]), "answer a")
+    cache.store("b", np.asarray([0.0, 1.0, 0.0]), "answer b")
+    assert cache.lookup(np.asarray([1.0, 0.0, 0.0])) == "answer a"
+
+    cache.store("c", np.asarray([0.0, 0.0, 1.0]), "answer c")
+
+    assert len(cache) == 2
+    assert cache.lookup(np.asarray([0.0, 1.0, 0.0])) is None
+    assert cache.lookup(np.asarray([1.0, 0.0, 0.0])) == "answer a"
+    assert cache.lookup(np.asarray([0.0, 0.0, 1.0])) == "answer c"
+
+
+def test_ask_agent_caches_only_tool_free_answers(agent_state, openai_client_factory, monkeypatch, capsys):
+    """Test that ask_agent caches tool-free answers and serves repeats without the model."""
+
+    async def mock_run_tool_async(name, arguments):
+        return "Balance: 1 ETH"
+
+    monkeypatch.setattr(AuctionAgent, "_init", lambda: (None, {}, MOCK_TOOL_SPECS[:ROUTER_TOP_K]))
+    monkeypatch.setattr(AuctionAgent, "run_tool_async", mock_run_tool_async)
+    client = openai_client_factory(
+        completions=[
+            [tool_call_chunk(0, "call_0", "tool_0", "{}")],
+            [text_chunk("You have 1 ETH.")],
+            [text_chunk("I can help.")],
+        ],
+        embeddings={
+            **MOCK_TOOL_EMBEDDINGS,
+            "what is my balance?": [1.0, 0.0, 0.0, 0.0, 0.0],
+            "what can you do?": [0.0, 0.0, 0.0, 0.0, 1.0],
+        },
+    )
+
+    async def ask_questions():
+        await ask_agent("what is my balance?")
+        await ask_agent("what can you do?")
+        await ask_agent("what can you do?")
+
+    run_with_client(client, ask_questions())
+
+    assert len(client.completion_requests) == 3
+    assert len(AuctionAgent._RESPONSE_CACHE) == 1
+    assert capsys.readouterr().out.count("I can help.") == 2
+
+
+@pytest.fixture
+def tool_calls(monkeypatch):
+    """Stub run_tool_async and return the list of tool calls it was asked to run."""
+    calls = []
+
+    async def mock_run_tool_async(name, arguments):
+        calls.append((name, arguments))
+        return f"{name} result {len(calls)}"
+
+    monkeypatch.setattr(AuctionAgent, "run_tool_async", mock_run_tool_async)
+    return calls
+
+
+def test_schedule_tool_shares_identical_read_only_calls(tool_calls):
+    """Test that identical get_balance calls, with keys in any order, share one future."""
+
+    async def schedule_twice():
+        seen = {}
+        first = schedule_tool(seen, "get_balance", '{"asset_id": "eth", "extra": 1}')
+        second = schedule_tool(seen, "get_balance", '{"extra": 1, "asset_id": "eth"}')
+        return first is second, await asyncio.gather(first, second)
+
+    shared, results = asyncio.run(schedule_twice())
+
+    assert shared
+    assert results == ["get_balance result 1", "get_balance result 1"]
+    assert len(tool_calls) == 1
+
+
+def test_schedule_tool_always_runs_state_changing_calls(tool_calls):
+    """Test that calls of tools outside IDEMPOTENT_TOOLS run every time."""
+    assert "finalize_nft_auction" not in IDEMPOTENT_TOOLS
+
+    async def schedule_twice():
+        seen = {}
+        return await asyncio.gather(
+            schedule_tool(seen, "finalize_nft_auction", '{"token_id": 1}'),
+            schedule_tool(seen, "finalize_nft_auction", '{"token_id": 1}'),
+        )
+
+    asyncio.run(schedule_twice())
+
+    assert len(tool_calls) == 2
+
+
+def test_run_agent_resets_dedup_for_each_assistant_message(agent_state, openai_client_factory, tool_calls):
+    """Test that an identical read-only call in a later assistant message runs again."""
+    client = openai_client_factory(completions=[
+        [
+            tool_call_chunk(0, "call_0", "get_balance", '{"asset_id": "eth"}'),
+            tool_call_chunk(1, "call_1", "get_balance", '{"asset_id": "eth"}'),
+        ],
+        [tool_call_chunk(0, "call_2", "request_faucet_funds", "{}")],
+        [tool_call_chunk(0, "call_3", "get_balance", '{"asset_id": "eth"}')],
+        [text_chunk("Done.")],
+    ])
+
+    run_with_client(client, run_agent(build_messages("check, fund, check"), MOCK_TOOL_SPECS, echo=False))
+
+    assert [name for name, _ in tool_calls] == ["get_balance", "request_faucet_funds", "get_balance"]
+
+
+def test_complete_joins_streamed_tool_call_fragments(openai_client_factory, capsys):
+    """Test that complete assembles interleaved tool-call fragments by index, alongside text."""
+    client = openai_client_factory(completions=[[
+        text_chunk("Checking "),
+        tool_call_chunk(0, "call_0", "get_", '{"asset'),
+        tool_call_chunk(1, "call_1", "mint_nft", '{"contract_address": '),
+        tool_call_chunk(0, None, "balance", '_id": "eth"}'),
+        text_chunk("now."),
+        tool_call_chunk(1, None, None, '"0xabc", "destination": "0xdef"}'),
+    ]])
+
+    message = run_with_client(client, complete(build_messages("check and mint"), MOCK_TOOL_SPECS))
+
+    assert message == {
+        "role": "assistant",
+        "content": "Checking now.",
+        "tool_calls": [
+            {
+                "id": "call_0",
+                "type": "function",
+                "function": {"name": "get_balance", "arguments": '{"asset_id": "eth"}'},
+            },
+            {
+                "id": "call_1",
+                "type": "function",
+                "function": {
+                    "name": "mint_nft",
+                    "arguments": '{"contract_address": "0xabc", "destination": "0xdef"}',
+                },
+            },
+        ],
+    }
+    assert "Checking now." in capsys.readouterr().out